@@ -1,18 +1,39 @@
 import os
+import sys
+import json
 import time
 import shutil
 import sqlite3
 import tkinter as tk
 from tkinter import ttk, messagebox
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import customtkinter as ctk
 from PIL import Image, ImageTk
 
 # -------------------- NEW DB SETUP --------------------
 DB_PATH = "chai_ki_chuski.db"
 
+# End-of-day close: incremental_vacuum runs in bounded steps so the
+# close never stalls on a large free list
+VACUUM_STEP_PAGES = 256
+VACUUM_MAX_STEPS = 16
+
+# `python cafe_system.py --close-day [YYYY-MM-DD]` runs the close against
+# the live database, so it must not be moved aside. Without a date it closes
+# yesterday, so a job scheduled just after midnight closes the day that ended
+CLOSE_DAY_MODE = "--close-day" in sys.argv[1:]
+CLOSE_DAY_DATE = None
+if CLOSE_DAY_MODE:
+    close_args = [a for a in sys.argv[1:] if a != "--close-day"]
+    try:
+        CLOSE_DAY_DATE = (date.fromisoformat(close_args[0]) if close_args
+                          else date.today() - timedelta(days=1))
+    except ValueError:
+        print(f"Invalid date for --close-day: {close_args[0]!r} (expected YYYY-MM-DD)", file=sys.stderr)
+        sys.exit(2)
+
 # Backup existing DB
-if os.path.exists(DB_PATH):
+if not CLOSE_DAY_MODE and os.path.exists(DB_PATH):
     bak_name = f"{DB_PATH}.backup_{int(time.time())}"
     shutil.move(DB_PATH, bak_name)
     print(f"Existing database moved to: {bak_name}")
@@ -20,6 +41,10 @@ if os.path.exists(DB_PATH):
 conn = sqlite3.connect(DB_PATH)
 c = conn.cursor()
 
+# Free pages are only reclaimable by incremental_vacuum in this mode; it takes
+# effect on a new file, older files are converted by run_maintenance()
+c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
 # Create clean schema with date tracking
 c.execute("""
 CREATE TABLE IF NOT EXISTS menu (
@@ -64,6 +89,23 @@ CREATE TABLE IF NOT EXISTS revenue (
 )
 """)
 
+# Frozen end-of-day totals; breakdowns are JSON so a past day is one row
+c.execute("""
+CREATE TABLE IF NOT EXISTS z_reports (
+    report_date DATE PRIMARY KEY,
+    orders INTEGER NOT NULL,
+    revenue REAL NOT NULL,
+    pending INTEGER NOT NULL,
+    last_revenue_id INTEGER NOT NULL,
+    items_json TEXT NOT NULL,
+    categories_json TEXT NOT NULL,
+    closed_at TEXT DEFAULT (datetime('now','localtime'))
+)
+""")
+
+c.execute("CREATE INDEX IF NOT EXISTS idx_orders_date ON orders(order_date)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_revenue_date ON revenue(revenue_date)")
+
 conn.commit()
 c.execute("SELECT COUNT(*) FROM menu")
 if c.fetchone()[0] == 0:
@@ -81,6 +123,125 @@ if c.fetchone()[0] == 0:
     c.executemany("INSERT INTO menu (category, item_name, price, stock) VALUES (?, ?, ?, ?)", sample_menu)
     conn.commit()
 
+# -------------------- END-OF-DAY CLOSE --------------------
+def close_day(day=None):
+    """Freeze one day's totals into z_reports (re-closing replaces the row)."""
+    # Normalise to YYYY-MM-DD; report_date is compared as text in date ranges
+    day = str(date.fromisoformat(str(day)) if day else datetime.now().date())
+
+    # last_revenue_id marks where the report stops; later sales for the day are added on top
+    c.execute("SELECT COALESCE(SUM(amount), 0), COUNT(*), COALESCE(MAX(id), 0) FROM revenue WHERE revenue_date=?", (day,))
+    revenue, orders, last_revenue_id = c.fetchone()
+    c.execute("SELECT COUNT(*) FROM orders WHERE order_date=? AND status='Pending'", (day,))
+    pending = c.fetchone()[0]
+
+    # Orders only keep "Name xQty, ..." so each order's total is split across its
+    # lines by current menu price (by quantity if no price is known); the
+    # breakdown then adds up to the amounts actually charged
+    c.execute("SELECT category, item_name, price FROM menu")
+    menu_info = {name: (cat, float(price)) for cat, name, price in c.fetchall()}
+
+    items, categories = {}, {}
+    c.execute("SELECT items, total FROM orders WHERE order_date=?", (day,))
+    for summary, total in c.fetchall():
+        lines = []
+        for part in (summary or "").split(", "):
+            name, sep, qty = part.rpartition(" x")
+            if not sep or not qty.isdigit():
+                continue
+            cat, price = menu_info.get(name, ("Other", 0.0))
+            lines.append((name, cat, int(qty), int(qty) * price))
+        est_total = sum(est for _, _, _, est in lines)
+        qty_total = sum(qty for _, _, qty, _ in lines)
+        if not est_total and not qty_total:
+            # Nothing to split by (empty or unparseable summary); keep the
+            # money so the breakdown still adds up to the day's order totals
+            for bucket in (items, categories):
+                entry = bucket.setdefault("Unattributed", {"qty": 0, "revenue": 0.0})
+                entry["revenue"] += total or 0
+            continue
+        for name, cat, qty, est in lines:
+            share = est / est_total if est_total else qty / qty_total
+            for bucket, key in ((items, name), (categories, cat)):
+                entry = bucket.setdefault(key, {"qty": 0, "revenue": 0.0})
+                entry["qty"] += qty
+                entry["revenue"] += (total or 0) * share
+    for bucket in (items, categories):
+        for entry in bucket.values():
+            entry["revenue"] = round(entry["revenue"], 2)
+
+    try:
+        c.execute("""
+            INSERT OR REPLACE INTO z_reports
+                (report_date, orders, revenue, pending, last_revenue_id, items_json, categories_json)
+            VALUES (?,?,?,?,?,?,?)
+        """, (day, orders, round(revenue, 2), pending, last_revenue_id, json.dumps(items), json.dumps(categories)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    run_maintenance()
+    return {"date": day, "orders": orders, "revenue": round(revenue, 2), "pending": pending,
+            "items": items, "categories": categories, "late_orders": 0}
+
+def run_maintenance(step_pages=VACUUM_STEP_PAGES, max_steps=VACUUM_MAX_STEPS):
+    """Refresh planner statistics and hand free pages back to the OS in bounded steps."""
+    c.execute("SELECT COUNT(*) FROM sqlite_master WHERE name='sqlite_stat1'")
+    if c.fetchone()[0] == 0:
+        c.execute("ANALYZE")
+    else:
+        c.execute("PRAGMA optimize")
+    conn.commit()
+
+    # One-time conversion of a file created before incremental auto-vacuum
+    c.execute("PRAGMA auto_vacuum")
+    if c.fetchone()[0] != 2:
+        print("Converting database to incremental auto-vacuum (one-time full VACUUM)...")
+        c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        c.execute("VACUUM")
+
+    for _ in range(max_steps):
+        c.execute("PRAGMA freelist_count")
+        if c.fetchone()[0] == 0:
+            break
+        # executescript steps the pragma to completion; execute() frees one page per call
+        conn.executescript(f"PRAGMA incremental_vacuum({int(step_pages)});")
+
+def load_z_report(day):
+    c.execute("""
+        SELECT z.report_date, z.orders, z.revenue, z.pending, z.items_json, z.categories_json,
+               z.closed_at, COUNT(r.id)
+        FROM z_reports z
+        LEFT JOIN revenue r ON r.revenue_date = z.report_date AND r.id > z.last_revenue_id
+        WHERE z.report_date=?
+        GROUP BY z.report_date
+    """, (str(day),))
+    row = c.fetchone()
+    if not row:
+        return None
+    report_date, orders, revenue, pending, items_json, categories_json, closed_at, late_orders = row
+    return {"date": report_date, "orders": orders, "revenue": revenue, "pending": pending,
+            "items": json.loads(items_json), "categories": json.loads(categories_json),
+            "closed_at": closed_at, "late_orders": late_orders}
+
+def format_z_report(report):
+    lines = [f"Z-Report: {report['date']}",
+             f"Orders: {report['orders']}",
+             f"Revenue: ₹{report['revenue']:.2f}",
+             f"Pending: {report['pending']}", ""]
+    if report.get("late_orders"):
+        lines += [f"⚠ {report['late_orders']} order(s) taken after close are not in this report.",
+                  "Close the day again to refresh it.", ""]
+    lines.append("By Category (order totals split by current menu price):")
+    for cat, v in sorted(report["categories"].items()):
+        lines.append(f"  {cat}: {v['qty']} sold, ₹{v['revenue']:.2f}")
+    lines.append("")
+    lines.append("By Item (order totals split by current menu price):")
+    for name, v in sorted(report["items"].items()):
+        lines.append(f"  {name}: {v['qty']} sold, ₹{v['revenue']:.2f}")
+    return "\n".join(lines)
+
 class CafeApp:
     def __init__(self, root):
         self.root = root
@@ -558,6 +719,8 @@ class CafeApp:
                      command=lambda: self.display_revenue("year")).pack(side="left", padx=5)
         ctk.CTkButton(btn_frame, text="All Time", width=80, fg_color="#D4623A", hover_color="#B84D2E",
                      command=lambda: self.display_revenue("all")).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="🔒 Close Day", width=90, fg_color="#228B22", hover_color="#1a6b1a",
+                     command=self.close_day_clicked).pack(side="right", padx=10)
 
         # Revenue stats frame
         self.revenue_frame = ctk.CTkFrame(self.main_frame, fg_color="white")
@@ -595,21 +758,35 @@ class CafeApp:
             end_date = None
             period_name = "All Time"
 
-        # Query revenue
+        # Query revenue: closed days come from their Z-report row plus any sales
+        # taken after the close, open days from raw rows
         if start_date:
             c.execute("""
-                SELECT SUM(amount), COUNT(*), revenue_date
+                SELECT z.revenue + COALESCE(SUM(r.amount), 0), z.orders + COUNT(r.id), z.report_date, COUNT(r.id)
+                FROM z_reports z
+                LEFT JOIN revenue r ON r.revenue_date = z.report_date AND r.id > z.last_revenue_id
+                WHERE z.report_date BETWEEN ? AND ?
+                GROUP BY z.report_date
+                UNION ALL
+                SELECT SUM(amount), COUNT(*), revenue_date, 0
                 FROM revenue
                 WHERE revenue_date BETWEEN ? AND ?
+                  AND revenue_date NOT IN (SELECT report_date FROM z_reports)
                 GROUP BY revenue_date
-                ORDER BY revenue_date DESC
-            """, (str(start_date), str(end_date)))
+                ORDER BY 3 DESC
+            """, (str(start_date), str(end_date), str(start_date), str(end_date)))
         else:
             c.execute("""
-                SELECT SUM(amount), COUNT(*), revenue_date
+                SELECT z.revenue + COALESCE(SUM(r.amount), 0), z.orders + COUNT(r.id), z.report_date, COUNT(r.id)
+                FROM z_reports z
+                LEFT JOIN revenue r ON r.revenue_date = z.report_date AND r.id > z.last_revenue_id
+                GROUP BY z.report_date
+                UNION ALL
+                SELECT SUM(amount), COUNT(*), revenue_date, 0
                 FROM revenue
+                WHERE revenue_date NOT IN (SELECT report_date FROM z_reports)
                 GROUP BY revenue_date
-                ORDER BY revenue_date DESC
+                ORDER BY 3 DESC
             """)
         
         rows = c.fetchall()
@@ -630,6 +807,10 @@ class CafeApp:
             avg = total_revenue / total_orders
             ctk.CTkLabel(stats_frame, text=f"Average per Order: ₹{avg:.2f}", 
                         font=("Arial", 14), text_color="#8B4513").pack(pady=5)
+        stale_days = [row[2] for row in rows if row[3]]
+        if stale_days:
+            ctk.CTkLabel(stats_frame, text=f"⚠ Sales after close included for {', '.join(stale_days)} — Z-report out of date, close again to refresh",
+                        font=("Arial", 12, "bold"), text_color="#B22222").pack(pady=5)
 
         # Display detailed table
         ctk.CTkLabel(self.revenue_frame, text="Daily Breakdown:", 
@@ -646,9 +827,50 @@ class CafeApp:
         for row in rows:
             if row[0]:
                 self.revenue_table.insert("", "end", values=(row[2], row[1], f"₹{row[0]:.2f}"))
+        self.revenue_table.bind("<Double-1>", self.on_revenue_row_open)
+
+    def close_day_clicked(self):
+        today = str(datetime.now().date())
+        if not messagebox.askyesno("Close Day", f"Freeze totals for {today} and run database maintenance?"):
+            return
+        try:
+            report = close_day(today)
+        except Exception as ex:
+            messagebox.showerror("Error", f"Could not close day: {ex}")
+            return
+        if hasattr(self, "revenue_frame") and self.revenue_frame.winfo_exists():
+            self.display_revenue("today")
+        self.show_z_report(report)
+
+    def on_revenue_row_open(self, event):
+        sel = self.revenue_table.selection()
+        if not sel: return
+        report = load_z_report(self.revenue_table.item(sel[0], "values")[0])
+        if not report:
+            messagebox.showinfo("Z-Report", "This day has not been closed yet.")
+            return
+        self.show_z_report(report)
+
+    def show_z_report(self, report):
+        popup = ctk.CTkToplevel(self.root)
+        popup.title(f"Z-Report - {report['date']}")
+        popup.geometry("450x520")
+        popup.configure(fg_color="#FFFBF7")
+
+        textbox = ctk.CTkTextbox(popup, width=410, height=400)
+        textbox.pack(pady=10, padx=10)
+        textbox.configure(state="normal")
+        textbox.insert("end", f"🍵 Chai Ki Chuski\n{format_z_report(report)}\n")
+        textbox.configure(state="disabled")
+
+        ctk.CTkButton(popup, text="Close", fg_color="#D4623A", hover_color="#B84D2E",
+                     command=popup.destroy).pack(pady=10)
 
 # -------------------- RUN --------------------
 if __name__ == "__main__":
+    if CLOSE_DAY_MODE:
+        print(format_z_report(close_day(CLOSE_DAY_DATE)))
+        sys.exit(0)
     root = ctk.CTk()
     app = CafeApp(root)
     root.mainloop()